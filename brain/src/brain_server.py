@@ -1,10 +1,12 @@
 import asyncio
-import json
 import os
+import re
+import sys
 import time
 from dataclasses import dataclass
-from typing import Dict, Optional
+from typing import Any, Dict, List, Optional, Sequence, Union
 
+import orjson
 import websockets
 from websockets import WebSocketServerProtocol
 from websockets.exceptions import ConnectionClosed
@@ -13,14 +15,69 @@ from dotenv import load_dotenv
 from .openai_pipe import OpenAIPipeline, BrainConfig
 
 
+# sentence boundary: terminal punctuation followed by whitespace (so "3.5" stays intact)
+_SENTENCE_END = re.compile(r"(?<=[.!?])\s+")
+
+# sentences synthesized ahead of playback per reply; keeps bursts under the TTS rate limit
+_TTS_MAX_IN_FLIGHT = 2
+_TTS_ATTEMPTS = 2
+
+# per-utterance audio cap: max_size only bounds a single frame, not the whole upload
+_MAX_UTTERANCE_S = 60
+_MAX_UTTERANCE_BYTES = 16_000_000
+
+# upper bound for one coalesced binary (PCM) frame
+_MAX_BATCH_BYTES = 64 * 1024
+
+
+def _coalesce(batch: List[Union[str, bytes]]) -> List[Union[str, bytes]]:
+    """
+    Merge runs of adjacent messages of the same kind into single frames:
+    JSON text messages are newline-joined (the client splits on newlines),
+    PCM bytes are concatenated up to _MAX_BATCH_BYTES. Order is preserved.
+    """
+    frames: List[Union[str, bytes]] = []
+    texts: List[str] = []
+    pcm: List[bytes] = []
+    pcm_len = 0
+
+    def flush_texts():
+        if texts:
+            frames.append("\n".join(texts))
+            texts.clear()
+
+    def flush_pcm():
+        nonlocal pcm_len
+        if pcm:
+            frames.append(pcm[0] if len(pcm) == 1 else b"".join(pcm))
+            pcm.clear()
+            pcm_len = 0
+
+    for msg in batch:
+        if isinstance(msg, str):
+            flush_pcm()
+            texts.append(msg)
+        else:
+            flush_texts()
+            if pcm_len + len(msg) > _MAX_BATCH_BYTES:
+                flush_pcm()
+            pcm.append(msg)
+            pcm_len += len(msg)
+    flush_texts()
+    flush_pcm()
+    return frames
+
+
 @dataclass
 class UtteranceBuffer:
-    pcm: bytearray
+    pcm: List[bytes]
     mode: str
     persona: Optional[str]
     sample_rate: int
     channels: int
     started_at: float
+    n_bytes: int = 0
+    max_bytes: int = _MAX_UTTERANCE_BYTES
 
 
 class BrainServer:
@@ -29,38 +86,173 @@ class BrainServer:
         pipeline: OpenAIPipeline,
         shared_secret: str = "",
         persona_prompts: Optional[Dict[str, str]] = None,
+        wake_words: Sequence[str] = ("samantha", "krishna"),
     ):
         self.pipeline = pipeline
         self.shared_secret = shared_secret.strip()
         self.buffers: Dict[WebSocketServerProtocol, Optional[UtteranceBuffer]] = {}
-        self.persona_prompts = persona_prompts or {}
-
-    async def send_status(self, ws: WebSocketServerProtocol, state: str, detail: str = ""):
+        self.send_queues: Dict[WebSocketServerProtocol, "asyncio.Queue[Union[str, bytes]]"] = {}
+        # frozen at startup: byte-identical system prompts every turn keep the LLM prefix cache warm
+        self.persona_prompts = {k: sys.intern(v) for k, v in (persona_prompts or {}).items()}
+        # one compiled alternation: single case-insensitive pass over the transcript, no lower() copy
+        self._wake_re = re.compile(r"|".join(re.escape(w) for w in wake_words), re.IGNORECASE)
+
+    def _ensure_open(self, ws: WebSocketServerProtocol):
+        # the sender drops the queue when it exits; abandon whatever turn is in progress
+        if ws not in self.send_queues:
+            raise ConnectionClosed(None, None)
+
+    def _send(self, ws: WebSocketServerProtocol, msg: Union[str, bytes]):
+        self._ensure_open(ws)
+        self.send_queues[ws].put_nowait(msg)
+
+    def _send_json(self, ws: WebSocketServerProtocol, obj: Dict[str, Any]):
+        # orjson -> bytes; decode so websockets still sends a text frame
+        self._send(ws, orjson.dumps(obj).decode())
+
+    async def _sender(self, ws: WebSocketServerProtocol, q: "asyncio.Queue[Union[str, bytes]]"):
+        # Drain everything queued since the last wakeup and send it as few frames as possible.
         try:
-            await ws.send(json.dumps({"type": "status", "state": state, "detail": detail}))
-        except Exception:
+            while True:
+                batch = [await q.get()]
+                while True:
+                    try:
+                        batch.append(q.get_nowait())
+                    except asyncio.QueueEmpty:
+                        break
+                for frame in _coalesce(batch):
+                    await ws.send(frame)
+        except ConnectionClosed:
             pass
+        except Exception as e:
+            print(f"[BRAIN] sender failed: {e!r}")
+        finally:
+            # nothing can reach the client any more: stop queuing and end the handler
+            self.send_queues.pop(ws, None)
+            await ws.close()
+
+    def send_status(self, ws: WebSocketServerProtocol, state: str, detail: str = ""):
+        self._send_json(ws, {"type": "status", "state": state, "detail": detail})
 
     def _detect_wake_persona(self, text: str) -> Optional[str]:
-        t = text.lower()
-        if "samantha" in t:
-            return "samantha"
-        if "krishna" in t:
-            return "krishna"
-        return None
+        m = self._wake_re.search(text)
+        return m.group(0).lower() if m else None
 
     def _persona_system_prompt(self, persona: Optional[str]) -> Optional[str]:
         if not persona:
             return None
         return self.persona_prompts.get(persona)
 
+    async def _tts_into(
+        self,
+        sentence: str,
+        out: "asyncio.Queue[Optional[bytes]]",
+        limit: asyncio.Semaphore,
+    ):
+        try:
+            async with limit:
+                for attempt in range(1, _TTS_ATTEMPTS + 1):
+                    sent_any = False
+                    try:
+                        async for chunk in self.pipeline.stream_tts(sentence):
+                            sent_any = True
+                            await out.put(chunk)
+                        return
+                    except Exception as e:
+                        # a retry after partial audio would repeat it; only retry clean failures
+                        if sent_any or attempt == _TTS_ATTEMPTS:
+                            print(f"[TTS] failed for {sentence!r}: {e}")
+                            return
+                        print(f"[TTS] retrying {sentence!r} after error: {e}")
+                        await asyncio.sleep(0.5)
+        finally:
+            await out.put(None)
+
+    async def _reply_and_speak(
+        self,
+        ws: WebSocketServerProtocol,
+        text: str,
+        sys_prompt: Optional[str],
+        persona: Optional[str],
+    ) -> str:
+        """
+        Stream the LLM reply and start TTS for each sentence as soon as it is
+        complete, while later sentences are still being generated. Audio is
+        forwarded to the client strictly in sentence order.
+        """
+        # one queue per sentence, queued in order; None marks the end of the reply
+        sentence_audio: "asyncio.Queue[Optional[asyncio.Queue]]" = asyncio.Queue()
+        tts_tasks = []
+        tts_limit = asyncio.Semaphore(_TTS_MAX_IN_FLIGHT)
+        # tts_start must always be paired with tts_end so the client flushes playback
+        tts_state = {"started": False, "ended": False}
+
+        def end_tts():
+            if tts_state["started"] and not tts_state["ended"]:
+                tts_state["ended"] = True
+                self._send_json(ws, {"type": "tts_end", "persona": persona})
+
+        async def forward_audio():
+            while True:
+                q = await sentence_audio.get()
+                if q is None:
+                    break
+                while True:
+                    chunk = await q.get()
+                    if chunk is None:
+                        break
+                    if not tts_state["started"]:
+                        tts_state["started"] = True
+                        self.send_status(ws, "SPEAKING", "Speaking…")
+                        self._send_json(ws, {"type": "tts_start", "persona": persona})
+                    self._send(ws, chunk)
+            end_tts()
+
+        def speak(sentence: str):
+            sentence = sentence.strip()
+            if not sentence:
+                return
+            q: "asyncio.Queue[Optional[bytes]]" = asyncio.Queue()
+            tts_tasks.append(asyncio.create_task(self._tts_into(sentence, q, tts_limit)))
+            sentence_audio.put_nowait(q)
+
+        forward_task = asyncio.create_task(forward_audio())
+        parts = []
+        pending = ""
+        try:
+            async for delta in self.pipeline.llm_stream(text, sys_prompt):
+                self._ensure_open(ws)
+                parts.append(delta)
+                pending += delta
+                pieces = _SENTENCE_END.split(pending)
+                for sentence in pieces[:-1]:
+                    speak(sentence)
+                pending = pieces[-1]
+            speak(pending)
+
+            reply = "".join(parts).strip()
+            self._send_json(ws, {"type": "assistant_text", "persona": persona, "text": reply})
+
+            sentence_audio.put_nowait(None)
+            await forward_task
+            return reply
+        finally:
+            forward_task.cancel()
+            for t in tts_tasks:
+                t.cancel()
+            try:
+                end_tts()
+            except ConnectionClosed:
+                pass
+
     async def handle_client(self, ws: WebSocketServerProtocol):
         client_id = "unknown"
         self.buffers[ws] = None
+        sender_task: Optional[asyncio.Task] = None
 
         try:
             raw = await ws.recv()
-            hello = json.loads(raw)
+            hello = orjson.loads(raw)
             if hello.get("type") != "hello":
                 await ws.close()
                 return
@@ -74,17 +266,26 @@ class BrainServer:
                 return
 
             print(f"[BRAIN] client connected: {client_id} sr={sr} ch={ch}")
-            await self.send_status(ws, "IDLE", "Connected")
+            send_q: "asyncio.Queue[Union[str, bytes]]" = asyncio.Queue()
+            self.send_queues[ws] = send_q
+            sender_task = asyncio.create_task(self._sender(ws, send_q))
+            self.send_status(ws, "IDLE", "Connected")
 
             async for msg in ws:
                 if isinstance(msg, (bytes, bytearray)):
                     buf = self.buffers.get(ws)
                     if buf:
-                        buf.pcm.extend(msg)
+                        if buf.n_bytes + len(msg) > buf.max_bytes:
+                            print(f"[BRAIN] utterance from {client_id} over {buf.max_bytes} bytes, dropped")
+                            self.buffers[ws] = None
+                            self.send_status(ws, "IDLE", "Utterance too long")
+                            continue
+                        buf.pcm.append(msg if isinstance(msg, bytes) else bytes(msg))
+                        buf.n_bytes += len(msg)
                     continue
 
                 try:
-                    data = json.loads(msg)
+                    data = orjson.loads(msg)
                 except Exception:
                     print(f"[BRAIN] bad JSON from {client_id}: {msg!r}")
                     continue
@@ -98,15 +299,17 @@ class BrainServer:
                     ch_msg = int(data.get("ch", ch))
 
                     self.buffers[ws] = UtteranceBuffer(
-                        pcm=bytearray(),
+                        pcm=[],
                         mode=mode,
                         persona=persona,
                         sample_rate=sr_msg,
                         channels=ch_msg,
                         started_at=time.time(),
+                        # sr/ch come from the client, so also clamp to an absolute ceiling
+                        max_bytes=max(0, min(sr_msg * ch_msg * 2 * _MAX_UTTERANCE_S, _MAX_UTTERANCE_BYTES)),
                     )
                     print(f"[BRAIN] utterance_start {client_id} mode={mode} persona={persona}")
-                    await self.send_status(ws, "LISTENING", "Listening…")
+                    self.send_status(ws, "LISTENING", "Listening…")
 
                 elif t == "utterance_end":
                     buf = self.buffers.get(ws)
@@ -115,17 +318,16 @@ class BrainServer:
                     mode = data.get("mode", getattr(buf, "mode", "query"))
                     persona = data.get("persona", getattr(buf, "persona", None))
 
-                    if not buf or len(buf.pcm) < 2000:
+                    if not buf or buf.n_bytes < 2000:
                         print(f"[BRAIN] utterance_end {client_id} (empty)")
-                        await self.send_status(ws, "IDLE")
+                        self.send_status(ws, "IDLE")
                         continue
 
-                    pcm_bytes = bytes(buf.pcm)
+                    pcm_bytes = b"".join(buf.pcm)
                     print(f"[BRAIN] utterance_end {client_id} mode={mode} persona={persona} bytes={len(pcm_bytes)}")
 
-                    await self.send_status(ws, "THINKING", "Transcribing…")
-                    text = await asyncio.to_thread(
-                        self.pipeline.stt,
+                    self.send_status(ws, "THINKING", "Transcribing…")
+                    text = await self.pipeline.stt(
                         pcm_bytes,
                         buf.sample_rate,
                         buf.channels,
@@ -134,30 +336,21 @@ class BrainServer:
                     print(f"[STT] {text!r}")
 
                     if not text:
-                        await self.send_status(ws, "IDLE")
+                        self.send_status(ws, "IDLE")
                         continue
 
                     if mode == "wake":
                         detected = self._detect_wake_persona(text)
-                        await ws.send(json.dumps({"type": "wake_result", "persona": detected}))
-                        await self.send_status(ws, "IDLE")
+                        self._send_json(ws, {"type": "wake_result", "persona": detected})
+                        self.send_status(ws, "IDLE")
                         continue
 
-                    await self.send_status(ws, "THINKING", "Thinking…")
+                    self.send_status(ws, "THINKING", "Thinking…")
                     sys_prompt = self._persona_system_prompt(persona)
-                    reply = await asyncio.to_thread(self.pipeline.llm, text, sys_prompt)
+                    reply = await self._reply_and_speak(ws, text, sys_prompt, persona)
                     print(f"[LLM/{persona}] {reply!r}")
 
-                    await ws.send(json.dumps({"type": "assistant_text", "persona": persona, "text": reply}))
-
-                    await self.send_status(ws, "SPEAKING", "Speaking…")
-                    await ws.send(json.dumps({"type": "tts_start", "persona": persona}))
-
-                    pcm24k = await asyncio.to_thread(self.pipeline.tts_pcm24k, reply)
-                    await ws.send(pcm24k)
-
-                    await ws.send(json.dumps({"type": "tts_end", "persona": persona}))
-                    await self.send_status(ws, "IDLE")
+                    self.send_status(ws, "IDLE")
 
         except ConnectionClosed:
             pass
@@ -166,6 +359,9 @@ class BrainServer:
         finally:
             print(f"[BRAIN] client disconnected: {client_id}")
             self.buffers.pop(ws, None)
+            self.send_queues.pop(ws, None)
+            if sender_task:
+                sender_task.cancel()
 
 
 async def main():
@@ -185,6 +381,8 @@ async def main():
         tts_model=os.environ.get("OPENAI_TTS_MODEL", "gpt-4o-mini-tts"),
         tts_voice=os.environ.get("OPENAI_TTS_VOICE", "coral"),
         system_prompt=os.environ.get("SYSTEM_PROMPT", "You are a helpful voice assistant."),
+        embed_model=os.environ.get("OPENAI_EMBED_MODEL", "text-embedding-3-small"),
+        semantic_cache_threshold=float(os.environ.get("SEMANTIC_CACHE_THRESHOLD", "0.95")),
     )
 
     persona_prompts = {
@@ -196,10 +394,25 @@ async def main():
     server = BrainServer(pipeline, shared_secret=secret, persona_prompts=persona_prompts)
 
     print(f"[BRAIN] starting ws server on {host}:{port}")
-    async with websockets.serve(server.handle_client, host, port, max_size=30_000_000):
+    # Utterance audio arrives as many <=64 KB binary frames, so a 2 MB frame cap
+    # (~60 s of 16 kHz PCM16) is generous; bounded queues cap per-client memory.
+    async with websockets.serve(
+        server.handle_client,
+        host,
+        port,
+        max_size=2_000_000,
+        max_queue=16,
+        read_limit=2**16,
+        write_limit=2**16,
+    ):
         await asyncio.Future()
 
 
 if __name__ == "__main__":
-    asyncio.run(main())
+    try:
+        import uvloop
+    except ImportError:
+        asyncio.run(main())
+    else:
+        uvloop.run(main())
 
@@ -1,9 +1,13 @@
-import io
-import wave
+import asyncio
+import functools
+import hashlib
+import struct
+from collections import OrderedDict
 from dataclasses import dataclass
-from typing import Optional, Dict, Any, List
+from typing import AsyncIterator, Optional, Dict, Any, List, Tuple
 
-from openai import OpenAI
+import numpy as np
+from openai import AsyncOpenAI
 
 from . import tools as brain_tools
 
@@ -15,6 +19,8 @@ class BrainConfig:
     tts_model: str
     tts_voice: str
     system_prompt: str
+    embed_model: str = "text-embedding-3-small"
+    semantic_cache_threshold: float = 0.95
 
 
 TOOLS: List[Dict[str, Any]] = [
@@ -57,74 +63,250 @@ TOOLS: List[Dict[str, Any]] = [
 ]
 
 
+class _SemanticCache:
+    """
+    Tiny per-system-prompt embedding cache: unit-norm float32 rows + replies,
+    looked up by cosine similarity (a single mat-vec).
+    """
+    def __init__(self, max_entries: int = 256):
+        self.max_entries = max_entries
+        self._mats: Dict[str, np.ndarray] = {}
+        self._replies: Dict[str, List[str]] = {}
+
+    def get(self, sys_prompt: str, emb: np.ndarray, threshold: float) -> Optional[str]:
+        mat = self._mats.get(sys_prompt)
+        if mat is None or not len(mat):
+            return None
+        sims = mat @ emb
+        i = int(np.argmax(sims))
+        if sims[i] < threshold:
+            return None
+        return self._replies[sys_prompt][i]
+
+    def put(self, sys_prompt: str, emb: np.ndarray, reply: str):
+        mat = self._mats.get(sys_prompt)
+        replies = self._replies.setdefault(sys_prompt, [])
+        row = emb[None, :]
+        if mat is None:
+            mat = row
+        else:
+            mat = np.vstack([mat[-(self.max_entries - 1):], row])
+            del replies[:-(self.max_entries - 1)]
+        self._mats[sys_prompt] = mat
+        replies.append(reply)
+
+
+def _consume_result(task: "asyncio.Future[Any]"):
+    # mark a discarded task's outcome as retrieved (no "exception was never retrieved")
+    if not task.cancelled():
+        task.exception()
+
+
 class OpenAIPipeline:
     def __init__(self, api_key: str, cfg: BrainConfig):
-        self.client = OpenAI(api_key=api_key)
+        self.client = AsyncOpenAI(api_key=api_key)
         self.cfg = cfg
 
+        # reply caches: exact (sys_prompt, text) LRU, semantic fallback, and TTS audio by reply text
+        self._llm_cache: "OrderedDict[Tuple[str, str], str]" = OrderedDict()
+        self._llm_cache_max = 256
+        self._sem_cache = _SemanticCache(max_entries=256)
+        self._tts_cache: "OrderedDict[str, bytes]" = OrderedDict()
+        self._tts_cache_max = 32
+
+        self.tool_timeout_s = 15.0
+
+    @staticmethod
+    @functools.lru_cache(maxsize=4)
+    def _wav_fmt_chunk(sample_rate: int, channels: int) -> bytes:
+        # "WAVE" + 16-bit PCM fmt chunk; fixed per stream format
+        block_align = channels * 2
+        return struct.pack(
+            "<4s4sIHHIIHH",
+            b"WAVE",
+            b"fmt ", 16, 1, channels, sample_rate, sample_rate * block_align, block_align, 16,
+        )
+
+    @staticmethod
+    @functools.lru_cache(maxsize=16)
+    def _prompt_cache_key(sys_prompt: str) -> str:
+        # stable per system prompt so OpenAI routes repeat turns to the same prefix cache
+        return "sys-" + hashlib.sha1(sys_prompt.encode("utf-8")).hexdigest()[:16]
+
     @staticmethod
     def pcm16_to_wav_bytes(pcm16: bytes, sample_rate: int, channels: int) -> bytes:
-        buf = io.BytesIO()
-        with wave.open(buf, "wb") as wf:
-            wf.setnchannels(channels)
-            wf.setsampwidth(2)
-            wf.setframerate(sample_rate)
-            wf.writeframes(pcm16)
-        return buf.getvalue()
-
-    def stt(self, pcm16: bytes, sample_rate: int, channels: int, language: Optional[str] = None) -> str:
+        # canonical 44-byte RIFF/WAVE header; only the two size fields vary per call
+        nbytes = len(pcm16)
+        return (
+            struct.pack("<4sI", b"RIFF", 36 + nbytes)
+            + OpenAIPipeline._wav_fmt_chunk(sample_rate, channels)
+            + struct.pack("<4sI", b"data", nbytes)
+            + pcm16
+        )
+
+    async def stt(self, pcm16: bytes, sample_rate: int, channels: int, language: Optional[str] = None) -> str:
         wav_bytes = self.pcm16_to_wav_bytes(pcm16, sample_rate, channels)
-        f = io.BytesIO(wav_bytes)
-        f.name = "audio.wav"
 
-        resp = self.client.audio.transcriptions.create(
+        resp = await self.client.audio.transcriptions.create(
             model=self.cfg.stt_model,
-            file=f,
+            file=("audio.wav", wav_bytes, "audio/wav"),
             language=language,
         )
         return (resp.text or "").strip()
 
-    def _call_tool(self, name: str, args: Dict[str, Any]) -> Dict[str, Any]:
+    async def _call_tool(self, name: str, args: Dict[str, Any]) -> Dict[str, Any]:
         door = args.get("door")
         if name == "garage_open":
-            return brain_tools.tool_garage_open(door=door)
-        if name == "garage_close":
-            return brain_tools.tool_garage_close(door=door)
-        return {"ok": False, "error": f"Unknown tool: {name}"}
+            coro_fn = brain_tools.tool_garage_open_async
+        elif name == "garage_close":
+            coro_fn = brain_tools.tool_garage_close_async
+        else:
+            return {"ok": False, "error": f"Unknown tool: {name}"}
 
-    def llm(self, text: str, system_prompt: Optional[str] = None) -> str:
+        try:
+            return await asyncio.wait_for(coro_fn(door=door), timeout=self.tool_timeout_s)
+        except asyncio.TimeoutError:
+            return {"ok": False, "error": f"Tool {name} timed out after {self.tool_timeout_s:.0f}s"}
+
+    async def _embed(self, text: str) -> Optional[np.ndarray]:
+        try:
+            resp = await self.client.embeddings.create(model=self.cfg.embed_model, input=text)
+        except Exception as e:
+            print(f"[LLM] embedding failed, skipping semantic cache: {e}")
+            return None
+        emb = np.asarray(resp.data[0].embedding, dtype=np.float32)
+        norm = float(np.linalg.norm(emb))
+        return emb / norm if norm else None
+
+    async def llm(self, text: str, system_prompt: Optional[str] = None) -> str:
+        parts = [delta async for delta in self.llm_stream(text, system_prompt)]
+        return "".join(parts).strip()
+
+    async def llm_stream(self, text: str, system_prompt: Optional[str] = None) -> AsyncIterator[str]:
+        """
+        Yield reply text deltas as the chat completion streams in.
+        Cache hits are yielded as a single delta.
+        """
         sys_prompt = system_prompt or self.cfg.system_prompt
 
+        key = (sys_prompt, " ".join(text.lower().split()))
+        cached = self._llm_cache.get(key)
+        if cached is not None:
+            self._llm_cache.move_to_end(key)
+            print("[LLM] exact cache hit")
+            yield cached
+            return
+
+        state = {"used_tools": False}
+        gen = self._llm_stream_uncached(text, sys_prompt, state).__aiter__()
+        # Start the chat stream right away; the embedding lookup runs alongside it
+        # instead of adding a round-trip in front of the first token.
+        first = asyncio.ensure_future(gen.__anext__())
+
+        emb: Optional[np.ndarray] = None
+        try:
+            if self.cfg.semantic_cache_threshold < 1.0:
+                emb = await self._embed(text)
+            if emb is not None:
+                cached = self._sem_cache.get(sys_prompt, emb, self.cfg.semantic_cache_threshold)
+                # once tools have started running, the live reply must win
+                if cached is not None and not state["used_tools"]:
+                    print("[LLM] semantic cache hit")
+                    first.cancel()
+                    # asyncio.wait never raises for `first` itself, but a cancellation
+                    # of this task still propagates
+                    await asyncio.wait([first])
+                    _consume_result(first)
+                    await gen.aclose()
+                    yield cached
+                    return
+        except BaseException:
+            # cancelled/failed while the chat stream was still starting: don't leak it
+            first.cancel()
+            first.add_done_callback(_consume_result)
+            raise
+
+        parts: List[str] = []
+        try:
+            delta = await first
+        except StopAsyncIteration:
+            delta = None
+        if delta is not None:
+            parts.append(delta)
+            yield delta
+            async for delta in gen:
+                parts.append(delta)
+                yield delta
+        reply = "".join(parts).strip()
+
+        # tool calls have side effects (garage) and live state; never replay them from cache
+        if reply and not state["used_tools"]:
+            self._llm_cache[key] = reply
+            if len(self._llm_cache) > self._llm_cache_max:
+                self._llm_cache.popitem(last=False)
+            if emb is not None:
+                self._sem_cache.put(sys_prompt, emb, reply)
+
+    async def _llm_stream_uncached(self, text: str, sys_prompt: str, state: Dict[str, Any]) -> AsyncIterator[str]:
         messages: List[Dict[str, Any]] = [
             {"role": "system", "content": sys_prompt},
             {"role": "user", "content": text},
         ]
 
-        resp = self.client.chat.completions.create(
+        # Static prefix first (tools, then the frozen system prompt) so it hits
+        # OpenAI's automatic prompt cache; only the user turn varies.
+        cache_key = self._prompt_cache_key(sys_prompt)
+        stream = await self.client.chat.completions.create(
             model=self.cfg.chat_model,
             messages=messages,
             tools=TOOLS,
             tool_choice="auto",
+            stream=True,
+            extra_body={"prompt_cache_key": cache_key},
         )
-        msg = resp.choices[0].message
-        tool_calls = getattr(msg, "tool_calls", None)
 
-        if not tool_calls:
-            return (msg.content or "").strip()
+        content_parts: List[str] = []
+        # tool call fragments arrive spread over many chunks, keyed by index
+        calls: Dict[int, Dict[str, str]] = {}
+        try:
+            async for chunk in stream:
+                if not chunk.choices:
+                    continue
+                delta = chunk.choices[0].delta
+                if delta.content:
+                    content_parts.append(delta.content)
+                    yield delta.content
+                for tc in delta.tool_calls or []:
+                    call = calls.setdefault(tc.index, {"id": "", "name": "", "arguments": ""})
+                    if tc.id:
+                        call["id"] = tc.id
+                    if tc.function and tc.function.name:
+                        call["name"] += tc.function.name
+                    if tc.function and tc.function.arguments:
+                        call["arguments"] += tc.function.arguments
+        finally:
+            # release the HTTP response if we're cancelled mid-stream (e.g. semantic cache hit)
+            await stream.close()
+
+        if not calls:
+            return
+
+        state["used_tools"] = True
+        tool_calls = [calls[i] for i in sorted(calls)]
 
         import json as pyjson
 
         messages.append(
             {
                 "role": "assistant",
-                "content": msg.content,
+                "content": "".join(content_parts) or None,
                 "tool_calls": [
                     {
-                        "id": tc.id,
+                        "id": tc["id"],
                         "type": "function",
                         "function": {
-                            "name": tc.function.name,
-                            "arguments": tc.function.arguments,
+                            "name": tc["name"],
+                            "arguments": tc["arguments"],
                         },
                     }
                     for tc in tool_calls
@@ -133,43 +315,63 @@ class OpenAIPipeline:
         )
 
         for tc in tool_calls:
-            fn_name = tc.function.name
-            raw_args = tc.function.arguments or "{}"
+            fn_name = tc["name"]
+            raw_args = tc["arguments"] or "{}"
             try:
                 args_dict = pyjson.loads(raw_args)
             except Exception:
                 args_dict = {}
 
-            result = self._call_tool(fn_name, args_dict)
+            result = await self._call_tool(fn_name, args_dict)
 
             messages.append(
                 {
                     "role": "tool",
                     "name": fn_name,
-                    "tool_call_id": tc.id,
+                    "tool_call_id": tc["id"],
                     "content": pyjson.dumps(result),
                 }
             )
 
-        resp2 = self.client.chat.completions.create(
+        # same tools block keeps the cached prefix; "none" stops a second round of calls
+        stream2 = await self.client.chat.completions.create(
             model=self.cfg.chat_model,
             messages=messages,
+            tools=TOOLS,
+            tool_choice="none",
+            stream=True,
+            extra_body={"prompt_cache_key": cache_key},
         )
-        final_msg = resp2.choices[0].message
-        return (final_msg.content or "").strip()
+        try:
+            async for chunk in stream2:
+                if chunk.choices and chunk.choices[0].delta.content:
+                    yield chunk.choices[0].delta.content
+        finally:
+            await stream2.close()
 
-    def tts_pcm24k(self, text: str) -> bytes:
-        resp = self.client.audio.speech.create(
+    async def stream_tts(self, text: str, chunk_size: int = 4096) -> AsyncIterator[bytes]:
+        """
+        Yield raw PCM16 @ 24 kHz mono as it arrives from the speech API.
+        Complete clips are kept in the TTS cache and replayed in chunk_size pieces.
+        """
+        cached = self._tts_cache.get(text)
+        if cached is not None:
+            self._tts_cache.move_to_end(text)
+            for i in range(0, len(cached), chunk_size):
+                yield cached[i:i + chunk_size]
+            return
+
+        parts: List[bytes] = []
+        async with self.client.audio.speech.with_streaming_response.create(
             model=self.cfg.tts_model,
             voice=self.cfg.tts_voice,
             input=text,
             response_format="pcm",
-        )
-
-        # Critical fix: openai-python returns HttpxBinaryResponseContent here in your env.
-        if hasattr(resp, "read"):
-            return resp.read()
-        if isinstance(resp, (bytes, bytearray)):
-            return bytes(resp)
-        return bytes(resp)
+        ) as resp:
+            async for chunk in resp.iter_bytes(chunk_size=chunk_size):
+                parts.append(chunk)
+                yield chunk
 
+        self._tts_cache[text] = b"".join(parts)
+        if len(self._tts_cache) > self._tts_cache_max:
+            self._tts_cache.popitem(last=False)
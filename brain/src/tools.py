@@ -1,14 +1,126 @@
 import os
 import asyncio
-from typing import Dict, Any, Optional
+from typing import Dict, Any, List, Optional
 
 from meross_iot.http_api import MerossHttpClient
 from meross_iot.manager import MerossManager
+from meross_iot.model.exception import CommandTimeoutError
+
+
+# Warm Meross session shared across tool calls (login + MQTT + discovery happen once).
+_mgr: Optional[MerossManager] = None
+_http_client: Optional[MerossHttpClient] = None
+_mgr_loop: Optional[asyncio.AbstractEventLoop] = None
+_mgr_lock: Optional[asyncio.Lock] = None
+_devices_cache: List[Any] = []
+# resolved garage per requested door ("left"/"right"/"_default_"), already state-synced once
+_garage_by_door: Dict[str, Any] = {}
+_keepalive_task: Optional["asyncio.Task[None]"] = None
+
+_KEEPALIVE_INTERVAL_S = 240
+
+
+def _find_garages(mgr: MerossManager) -> List[Any]:
+    garages = mgr.find_devices(device_type="msg100")
+
+    if not garages:
+        all_devices = mgr.find_devices()
+        garages = [
+            d for d in all_devices
+            if (d.device_type or "").lower().startswith("msg100")
+            or "garage" in (d.device_type or "").lower()
+        ]
+    return garages
+
+
+async def _keepalive():
+    # periodic lightweight discovery keeps the Meross cloud/MQTT session from going stale
+    while True:
+        await asyncio.sleep(_KEEPALIVE_INTERVAL_S)
+        mgr = _mgr
+        if mgr is None:
+            return
+        try:
+            await mgr.async_device_discovery(update_subdevice_status=False)
+        except Exception as e:
+            print(f"[MEROSS] keepalive failed: {e}")
+
+
+def _reset_state():
+    global _mgr, _http_client, _devices_cache, _keepalive_task
+    if _keepalive_task is not None:
+        _keepalive_task.cancel()
+    _mgr, _http_client, _devices_cache, _keepalive_task = None, None, [], None
+    _garage_by_door.clear()
+
+
+async def _close_mgr():
+    mgr, http_client = _mgr, _http_client
+    _reset_state()
+    if mgr is not None:
+        mgr.close()
+    if http_client is not None:
+        try:
+            await http_client.async_logout()
+        except Exception as e:
+            print(f"[MEROSS] logout failed: {e}")
+
+
+async def _ensure_mgr() -> MerossManager:
+    """
+    Return the shared MerossManager, logging in and discovering devices on first use.
+
+    The session is bound to the event loop it was created on; if called from a
+    different loop, the old session is dropped and a fresh one is built.
+    """
+    global _mgr, _http_client, _mgr_loop, _mgr_lock, _devices_cache, _keepalive_task
+
+    loop = asyncio.get_running_loop()
+    if _mgr_loop is not loop:
+        if _mgr is not None:
+            # old loop is gone; can't await its logout, just disconnect MQTT
+            _mgr.close()
+        _reset_state()
+        _mgr_loop = loop
+        _mgr_lock = asyncio.Lock()
+
+    async with _mgr_lock:
+        if _mgr is not None:
+            return _mgr
+
+        email = os.environ.get("MEROSS_EMAIL")
+        password = os.environ.get("MEROSS_PASSWORD")
+        api_base_url = os.environ.get("MEROSS_API_BASE_URL", "https://iot.meross.com")
+
+        http_client = await MerossHttpClient.async_from_user_password(
+            email=email,
+            password=password,
+            api_base_url=api_base_url,
+        )
+        mgr = MerossManager(http_client=http_client)
+        try:
+            await mgr.async_init()
+            await mgr.async_device_discovery()
+        except Exception:
+            mgr.close()
+            try:
+                await http_client.async_logout()
+            except Exception as e:
+                # don't let a logout failure mask the original login/discovery error
+                print(f"[MEROSS] logout failed: {e}")
+            raise
+
+        _http_client = http_client
+        _mgr = mgr
+        _devices_cache = _find_garages(mgr)
+        _keepalive_task = asyncio.create_task(_keepalive())
+        print(f"[MEROSS] session ready, {len(_devices_cache)} garage device(s)")
+        return _mgr
 
 
 async def _garage_action(action: str, door: Optional[str]) -> Dict[str, Any]:
     """
-    Connect to Meross cloud, discover MSG100 devices, and open/close selected door.
+    Open/close the selected MSG100 door using the shared Meross session.
 
     door: "left", "right", or None (None = first found)
     """
@@ -17,35 +129,30 @@ async def _garage_action(action: str, door: Optional[str]) -> Dict[str, Any]:
     if not email or not password:
         return {"ok": False, "error": "MEROSS_EMAIL and MEROSS_PASSWORD must be set."}
 
-    api_base_url = os.environ.get("MEROSS_API_BASE_URL", "https://iot.meross.com")
-
-    http_client = await MerossHttpClient.async_from_user_password(
-        email=email,
-        password=password,
-        api_base_url=api_base_url,
-    )
-    mgr = MerossManager(http_client=http_client)
+    if action not in ("open", "close"):
+        return {"ok": False, "error": f"Unknown action: {action}"}
 
     try:
-        await mgr.async_init()
-        await mgr.async_device_discovery()
-
-        garages = mgr.find_devices(device_type="msg100")
-
-        if not garages:
-            all_devices = mgr.find_devices()
-            garages = [
-                d for d in all_devices
-                if (d.device_type or "").lower().startswith("msg100")
-                or "garage" in (d.device_type or "").lower()
-            ]
-
+        return await _garage_action_once(action, door)
+    except CommandTimeoutError:
+        # stale cloud/MQTT session: rebuild once and retry
+        print("[MEROSS] command timed out, re-initialising session")
+        await _close_mgr()
+        return await _garage_action_once(action, door)
+
+
+async def _garage_action_once(action: str, door: Optional[str]) -> Dict[str, Any]:
+    await _ensure_mgr()
+    door_norm = door.lower() if door else None
+    door_key = door_norm if door_norm in ("left", "right") else "_default_"
+
+    garage = _garage_by_door.get(door_key)
+    if garage is None:
+        garages = _devices_cache
         if not garages:
             return {"ok": False, "error": "No Meross MSG100 garage devices found."}
 
         selected = None
-        door_norm = door.lower() if door else None
-
         if door_norm in ("left", "right"):
             for g in garages:
                 name = (getattr(g, "name", "") or "").lower()
@@ -57,42 +164,53 @@ async def _garage_action(action: str, door: Optional[str]) -> Dict[str, Any]:
             selected = garages[0]
 
         garage = selected
+        # first use only: sync device state before the first command
         await garage.async_update()
+        _garage_by_door[door_key] = garage
 
-        if action == "open":
-            await garage.async_open()
-        elif action == "close":
-            await garage.async_close()
-        else:
-            return {"ok": False, "error": f"Unknown action: {action}"}
+    if action == "open":
+        await garage.async_open()
+    else:
+        await garage.async_close()
 
-        await garage.async_update()
+    await garage.async_update()
 
-        state_val = None
-        get_state = getattr(garage, "get_current_state", None)
-        if callable(get_state):
-            try:
-                state_val = get_state()
-            except Exception:
-                state_val = None
-
-        return {
-            "ok": True,
-            "device_name": getattr(garage, "name", "garage"),
-            "requested_door": door_norm,
-            "action": action,
-            "state": state_val,
-        }
+    state_val = None
+    get_state = getattr(garage, "get_current_state", None)
+    if callable(get_state):
+        try:
+            state_val = get_state()
+        except Exception:
+            state_val = None
+
+    return {
+        "ok": True,
+        "device_name": getattr(garage, "name", "garage"),
+        "requested_door": door_norm,
+        "action": action,
+        "state": state_val,
+    }
+
+
+async def tool_garage_open_async(door: Optional[str] = None) -> Dict[str, Any]:
+    return await _garage_action("open", door)
 
+
+async def tool_garage_close_async(door: Optional[str] = None) -> Dict[str, Any]:
+    return await _garage_action("close", door)
+
+
+async def _run_once(action: str, door: Optional[str]) -> Dict[str, Any]:
+    # one-shot loop: the session must not outlive it, so always close + log out
+    try:
+        return await _garage_action(action, door)
     finally:
-        mgr.close()
-        await http_client.async_logout()
+        await _close_mgr()
 
 
 def tool_garage_open(door: Optional[str] = None) -> Dict[str, Any]:
-    return asyncio.run(_garage_action("open", door))
+    return asyncio.run(_run_once("open", door))
 
 
 def tool_garage_close(door: Optional[str] = None) -> Dict[str, Any]:
-    return asyncio.run(_garage_action("close", door))
-
+    return asyncio.run(_run_once("close", door))
@@ -1,11 +1,14 @@
+import asyncio
 import queue
+import threading
 from dataclasses import dataclass
 from typing import Optional
 
 import numpy as np
 import sounddevice as sd
+import soxr
 
-from .audio_utils import pcm16_to_float, float_to_pcm16, resample_float
+from .audio_utils import Pcm16Encoder, pcm16_to_float
 
 
 @dataclass
@@ -35,8 +38,18 @@ class MicStream:
     """
     Captures mic audio from hardware sample rate, resamples to target_sr,
     and emits 20ms PCM16 frames at target_sr suitable for webrtcvad.
+
+    The PortAudio callback only copies raw hw-rate blocks into a queue; a
+    worker thread does resampling, framing and PCM16 conversion, and hands
+    frames to an asyncio.Queue on the given event loop.
     """
-    def __init__(self, device_substr: str, target_samplerate: int = 16000, frame_ms: int = 20):
+    def __init__(
+        self,
+        device_substr: str,
+        target_samplerate: int = 16000,
+        frame_ms: int = 20,
+        loop: Optional[asyncio.AbstractEventLoop] = None,
+    ):
         pick = pick_device_by_substring(device_substr, want_input=True)
         self.device_index = pick.index
         self.device_name = pick.name
@@ -47,36 +60,41 @@ class MicStream:
         self.target_sr = int(target_samplerate)
         self.frame_ms = int(frame_ms)
 
-        self._q: "queue.Queue[bytes]" = queue.Queue(maxsize=400)
+        self._loop = loop or asyncio.get_running_loop()
+        self._aq: "asyncio.Queue[bytes]" = asyncio.Queue(maxsize=400)
+        self._raw_q: "queue.Queue[Optional[np.ndarray]]" = queue.Queue(maxsize=100)
         self._stream: Optional[sd.InputStream] = None
+        self._worker_thread: Optional[threading.Thread] = None
 
         # compute hw blocksize to approximate frame_ms at hw_sr
         self.hw_block = int(round(self.hw_sr * self.frame_ms / 1000))
 
-        # internal float buffer at target sr
-        self._accum = np.zeros(0, dtype=np.float32)
+        # internal float ring buffer at target sr (1 s); _w/_r are running sample counts
+        self.frame_len = int(self.target_sr * self.frame_ms / 1000)
+        self._ring = np.empty(self.target_sr, dtype=np.float32)
+        self._frame = np.empty(self.frame_len, dtype=np.float32)
+        self._encoder = Pcm16Encoder(self.frame_len)
+        self._w = 0
+        self._r = 0
+
+        # streaming resampler keeps filter state across callbacks (no block-edge clicks)
+        self._rs: Optional[soxr.ResampleStream] = None
+        if self.hw_sr != self.target_sr:
+            self._rs = soxr.ResampleStream(self.hw_sr, self.target_sr, 1, dtype="float32")
 
     def start(self):
         def cb(indata, frames, time_info, status):
             if status:
                 print(f"[MIC] status: {status}")
 
-            # indata float32 with shape (frames, channels)
-            x = indata[:, 0].astype(np.float32)  # mono
-            # resample hw_sr -> target_sr
-            x_rs = resample_float(x, self.hw_sr, self.target_sr)
-            self._accum = np.concatenate([self._accum, x_rs])
-
-            # output exact frame_ms chunks
-            frame_len = int(self.target_sr * self.frame_ms / 1000)
-            while len(self._accum) >= frame_len:
-                chunk = self._accum[:frame_len]
-                self._accum = self._accum[frame_len:]
-                pcm = float_to_pcm16(chunk)
-                try:
-                    self._q.put_nowait(pcm)
-                except queue.Full:
-                    pass
+            # indata float32 with shape (frames, channels); keep the audio thread cheap
+            try:
+                self._raw_q.put_nowait(indata[:, 0].copy())
+            except queue.Full:
+                pass
+
+        self._worker_thread = threading.Thread(target=self._worker, name="mic-dsp", daemon=True)
+        self._worker_thread.start()
 
         self._stream = sd.InputStream(
             device=self.device_index,
@@ -89,23 +107,112 @@ class MicStream:
         self._stream.start()
         print(f"[MIC] started on device {self.device_index} ({self.device_name}), hw_sr={self.hw_sr} Hz, target_sr={self.target_sr} Hz")
 
+    def _worker(self):
+        while True:
+            x = self._raw_q.get()
+            if x is None:
+                return
+
+            # batch whatever else is pending into one resample call
+            blocks = [x]
+            while True:
+                try:
+                    nxt = self._raw_q.get_nowait()
+                except queue.Empty:
+                    break
+                if nxt is None:
+                    self._process(blocks)
+                    return
+                blocks.append(nxt)
+
+            self._process(blocks)
+
+    def _process(self, blocks):
+        x = blocks[0] if len(blocks) == 1 else np.concatenate(blocks)
+        # resample hw_sr -> target_sr
+        x_rs = self._rs.resample_chunk(x) if self._rs else x
+        self._ring_write(x_rs)
+
+        # output exact frame_ms chunks
+        while self._w - self._r >= self.frame_len:
+            pcm = self._encoder.encode(self._ring_read(self.frame_len))
+            try:
+                self._loop.call_soon_threadsafe(self._put_frame, pcm)
+            except RuntimeError:
+                # event loop already closed (shutdown)
+                return
+
+    def _put_frame(self, pcm: bytes):
+        # runs on the event loop thread
+        try:
+            self._aq.put_nowait(pcm)
+        except asyncio.QueueFull:
+            pass
+
+    def _ring_write(self, x: np.ndarray):
+        cap = len(self._ring)
+        n = len(x)
+        if n > cap:
+            x = x[-cap:]
+            n = cap
+        # overflow: drop the oldest samples
+        if self._w + n - self._r > cap:
+            self._r = self._w + n - cap
+
+        i = self._w % cap
+        first = min(n, cap - i)
+        self._ring[i:i + first] = x[:first]
+        if first < n:
+            self._ring[:n - first] = x[first:]
+        self._w += n
+
+    def _ring_read(self, n: int) -> np.ndarray:
+        cap = len(self._ring)
+        i = self._r % cap
+        first = min(n, cap - i)
+        self._r += n
+        if first == n:
+            return self._ring[i:i + n]
+        self._frame[:first] = self._ring[i:]
+        self._frame[first:n] = self._ring[:n - first]
+        return self._frame[:n]
+
     def stop(self):
         if self._stream:
             self._stream.stop()
             self._stream.close()
             self._stream = None
+        if self._worker_thread:
+            try:
+                self._raw_q.put(None, timeout=1.0)
+            except queue.Full:
+                pass
+            self._worker_thread.join(timeout=1.0)
+            self._worker_thread = None
         print("[MIC] stopped")
 
-    def queue(self) -> "queue.Queue[bytes]":
-        return self._q
+    def queue(self) -> "asyncio.Queue[bytes]":
+        return self._aq
 
 
 class SpeakerOut:
     """
     Plays PCM16 audio. Incoming from brain is PCM16 @ 24k.
     Output device likely runs at 44100; we resample to device SR for PortAudio.
+
+    Resampled audio goes into one float32 ring buffer; the PortAudio callback
+    copies exactly `frames` samples out of it, so chunk sizes from the brain
+    never need to line up with the device blocksize. Resampler state carries
+    over between play_pcm16 calls; flush() drains it at the end of a clip.
     """
-    def __init__(self, device_substr: str, samplerate: Optional[int] = None, channels: int = 2, blocksize: int = 1024):
+    def __init__(
+        self,
+        device_substr: str,
+        samplerate: Optional[int] = None,
+        channels: int = 2,
+        blocksize: int = 1024,
+        ring_seconds: int = 30,
+    ):
         pick = pick_device_by_substring(device_substr, want_input=False)
         self.device_index = pick.index
         self.device_name = pick.name
@@ -117,24 +224,35 @@ class SpeakerOut:
         self.channels = int(channels)
         self.blocksize = int(blocksize)
 
-        self._q: "queue.Queue[np.ndarray]" = queue.Queue(maxsize=200)
         self._stream: Optional[sd.OutputStream] = None
 
+        # TTS streams in faster than real time, so the ring holds a whole reply.
+        # _w/_r are running sample counts; the lock only guards the counters.
+        self._ring = np.zeros(self.samplerate * int(ring_seconds), dtype=np.float32)
+        self._w = 0
+        self._r = 0
+        self._lock = threading.Lock()
+
+        self._rs: Optional[soxr.ResampleStream] = None
+        self._rs_src_sr: Optional[int] = None
+
     def start(self):
         def cb(outdata, frames, time_info, status):
-            outdata[:] = 0
-            try:
-                x = self._q.get_nowait()
-            except queue.Empty:
-                return
+            with self._lock:
+                r = self._r
+                n = min(frames, self._w - r)
 
-            # x is mono float32
-            n = min(frames, len(x))
-            if self.channels == 1:
-                outdata[:n, 0] = x[:n]
-            else:
-                outdata[:n, 0] = x[:n]
-                outdata[:n, 1] = x[:n]
+            if n > 0:
+                cap = len(self._ring)
+                i = r % cap
+                first = min(n, cap - i)
+                # mono ring broadcast across all output channels
+                np.copyto(outdata[:first], self._ring[i:i + first, None])
+                if first < n:
+                    np.copyto(outdata[first:n], self._ring[:n - first, None])
+                with self._lock:
+                    self._r = r + n
+            outdata[n:] = 0
 
         self._stream = sd.OutputStream(
             device=self.device_index,
@@ -157,14 +275,37 @@ class SpeakerOut:
     def play_pcm16(self, pcm: bytes, src_sr: int = 24000):
         x = pcm16_to_float(pcm)
         if src_sr != self.samplerate:
-            x = resample_float(x, src_sr, self.samplerate)
+            if self._rs is None or self._rs_src_sr != src_sr:
+                self._rs = soxr.ResampleStream(src_sr, self.samplerate, 1, dtype="float32")
+                self._rs_src_sr = src_sr
+            x = self._rs.resample_chunk(x)
+        self._write(x)
 
-        step = self.blocksize
-        for i in range(0, len(x), step):
-            chunk = x[i:i+step]
-            if len(chunk) < step:
-                chunk = np.pad(chunk, (0, step - len(chunk)), mode="constant")
-            try:
-                self._q.put_nowait(chunk.astype(np.float32))
-            except queue.Full:
-                pass
+    def flush(self):
+        """End of a clip: drain the resampler tail into the ring."""
+        if self._rs is not None:
+            self._write(self._rs.resample_chunk(np.zeros(0, dtype=np.float32), last=True))
+            self._rs.clear()
+
+    def _write(self, x: np.ndarray):
+        cap = len(self._ring)
+        with self._lock:
+            w = self._w
+            free = cap - (w - self._r)
+
+        n = len(x)
+        if n > free:
+            # never overwrite audio that hasn't played yet
+            print(f"[SPEAKER] ring full, dropping {n - free} samples")
+            n = free
+        if n <= 0:
+            return
+
+        i = w % cap
+        first = min(n, cap - i)
+        self._ring[i:i + first] = x[:first]
+        if first < n:
+            self._ring[:n - first] = x[first:n]
+
+        with self._lock:
+            self._w = w + n
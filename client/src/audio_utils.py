@@ -1,10 +1,12 @@
 import numpy as np
 
 
+_PCM16_SCALE = np.float32(1.0 / 32768.0)
+
+
 def pcm16_to_float(pcm: bytes) -> np.ndarray:
-    x = np.frombuffer(pcm, dtype=np.int16).astype(np.float32)
-    x /= 32768.0
-    return x
+    # int16 * float32 scalar promotes straight to float32 in one pass
+    return np.frombuffer(pcm, dtype=np.int16) * _PCM16_SCALE
 
 
 def float_to_pcm16(x: np.ndarray) -> bytes:
@@ -13,17 +15,21 @@ def float_to_pcm16(x: np.ndarray) -> bytes:
     return y.tobytes()
 
 
-def resample_float(x: np.ndarray, src_sr: int, dst_sr: int) -> np.ndarray:
-    if src_sr == dst_sr:
-        return x
-    src_len = len(x)
-    dst_len = int(round(src_len * (dst_sr / src_sr)))
-    if dst_len <= 1:
-        return np.zeros(1, dtype=np.float32)
-    src_idx = np.linspace(0, src_len - 1, num=dst_len, dtype=np.float32)
-    left = np.floor(src_idx).astype(np.int32)
-    right = np.minimum(left + 1, src_len - 1)
-    frac = src_idx - left
-    y = (1.0 - frac) * x[left] + frac * x[right]
-    return y.astype(np.float32)
+class Pcm16Encoder:
+    """
+    float_to_pcm16 for a fixed frame size, reusing preallocated scratch
+    buffers so the per-frame hot path does no temporary allocations.
+    """
+    def __init__(self, frame_len: int):
+        self.frame_len = int(frame_len)
+        self._scratch_f = np.empty(self.frame_len, dtype=np.float32)
+        self._scratch_i = np.empty(self.frame_len, dtype=np.int16)
 
+    def encode(self, x: np.ndarray) -> bytes:
+        if len(x) != self.frame_len:
+            return float_to_pcm16(x)
+        np.multiply(x, 32767.0, out=self._scratch_f)
+        np.clip(self._scratch_f, -32768.0, 32767.0, out=self._scratch_f)
+        np.rint(self._scratch_f, out=self._scratch_f)
+        self._scratch_i[:] = self._scratch_f
+        return self._scratch_i.tobytes()
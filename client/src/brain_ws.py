@@ -1,30 +1,47 @@
-import json
 import os
 from typing import AsyncIterator, Optional, Union
 
+import orjson
 import websockets
-from dotenv import load_dotenv
+
+
+def _dumps(obj: dict) -> str:
+    # str, not bytes: websockets sends str as a text frame
+    return orjson.dumps(obj).decode()
+
+
+# keep each binary frame well under the brain's max_size
+_UPLOAD_CHUNK_BYTES = 64 * 1024
 
 
 class BrainWSClient:
-    def __init__(self):
-        load_dotenv()
-        self.host = os.environ.get("BRAIN_HOST", "localhost")
-        self.port = int(os.environ.get("BRAIN_PORT", "8765"))
-        self.shared_secret = os.environ.get("SHARED_SECRET", "")
-        self.client_id = os.environ.get("CLIENT_ID", "pi3-client")
+    """
+    Websocket link to the brain. Settings not passed in fall back to the
+    environment (the caller is expected to have run load_dotenv()).
+    """
+    def __init__(
+        self,
+        host: Optional[str] = None,
+        port: Optional[int] = None,
+        secret: Optional[str] = None,
+        client_id: Optional[str] = None,
+    ):
+        self.host = host if host is not None else os.environ.get("BRAIN_HOST", "localhost")
+        self.port = int(port if port is not None else os.environ.get("BRAIN_PORT", "8765"))
+        self.shared_secret = secret if secret is not None else os.environ.get("SHARED_SECRET", "")
+        self.client_id = client_id if client_id is not None else os.environ.get("CLIENT_ID", "pi3-client")
+        self.uri = f"ws://{self.host}:{self.port}"
         self.ws: Optional[websockets.WebSocketClientProtocol] = None
 
     async def connect(self, sr: int, ch: int):
-        uri = f"ws://{self.host}:{self.port}"
-        print(f"[WS] connecting to {uri}")
-        self.ws = await websockets.connect(uri, max_size=30_000_000)
+        print(f"[WS] connecting to {self.uri}")
+        self.ws = await websockets.connect(self.uri, max_size=30_000_000)
 
         hello = {"type": "hello", "client_id": self.client_id, "sr": sr, "ch": ch}
         if self.shared_secret:
             hello["secret"] = self.shared_secret
 
-        await self.ws.send(json.dumps(hello))
+        await self.ws.send(_dumps(hello))
         print("[WS] sent hello")
 
     async def close(self):
@@ -37,10 +54,11 @@ class BrainWSClient:
             raise RuntimeError("WS not connected")
 
         await self.ws.send(
-            json.dumps({"type": "utterance_start", "mode": mode, "persona": persona, "sr": sr, "ch": ch})
+            _dumps({"type": "utterance_start", "mode": mode, "persona": persona, "sr": sr, "ch": ch})
         )
-        await self.ws.send(pcm16)
-        await self.ws.send(json.dumps({"type": "utterance_end", "mode": mode, "persona": persona}))
+        for i in range(0, len(pcm16), _UPLOAD_CHUNK_BYTES):
+            await self.ws.send(pcm16[i:i + _UPLOAD_CHUNK_BYTES])
+        await self.ws.send(_dumps({"type": "utterance_end", "mode": mode, "persona": persona}))
 
     async def messages(self) -> AsyncIterator[Union[dict, bytes]]:
         if not self.ws:
@@ -49,5 +67,8 @@ class BrainWSClient:
             if isinstance(msg, (bytes, bytearray)):
                 yield bytes(msg)
             else:
-                yield json.loads(msg)
+                # the brain may batch several JSON messages into one frame, one per line
+                for line in msg.split("\n"):
+                    if line:
+                        yield orjson.loads(line)
 
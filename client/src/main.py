@@ -9,6 +9,7 @@ from dotenv import load_dotenv
 
 from .brain_ws import BrainWSClient
 from .audio_io import MicStream, SpeakerOut
+from .wakeword import LocalWakeWord
 
 
 IDLE = "IDLE"
@@ -24,11 +25,17 @@ async def main_async():
     mic_device_substr = os.environ.get("MIC_DEVICE_SUBSTR", "USB PnP Sound Device")
     speaker_device_substr = os.environ.get("SPEAKER_DEVICE_SUBSTR", "snd_rpi_hifiberry")
 
-    mic = MicStream(device_substr=mic_device_substr, target_samplerate=sample_rate, frame_ms=20)
+    mic = MicStream(
+        device_substr=mic_device_substr,
+        target_samplerate=sample_rate,
+        frame_ms=20,
+        loop=asyncio.get_running_loop(),
+    )
     speaker = SpeakerOut(device_substr=speaker_device_substr)
 
     brain = BrainWSClient()
     vad = webrtcvad.Vad(vad_level)
+    wake = LocalWakeWord.from_env()
 
     await brain.connect(sr=sample_rate, ch=1)
     mic.start()
@@ -66,6 +73,7 @@ async def main_async():
                 tts_persona = msg.get("persona")
                 print(f"[TTS] start persona={tts_persona}")
             elif t == "tts_end":
+                speaker.flush()
                 print(f"[TTS] end persona={msg.get('persona')}")
                 tts_persona = None
 
@@ -83,10 +91,8 @@ async def main_async():
         min_speech_frames = 5
         end_silence_frames = 10
 
-        loop = asyncio.get_event_loop()
-
         while True:
-            frame = await loop.run_in_executor(None, q.get)
+            frame = await q.get()
 
             if len(frame) != frame_bytes_len:
                 if len(frame) > frame_bytes_len:
@@ -109,6 +115,15 @@ async def main_async():
                         speeching = False
                         silence_frames = 0
 
+                        if state["mode"] == IDLE and wake is not None:
+                            # wake word handled on-device; nothing goes to the brain
+                            persona = await asyncio.to_thread(wake.detect, pcm16)
+                            if persona:
+                                print(f"[WAKE] persona={persona} (local)")
+                                state["mode"] = AWAIT_QUERY
+                                state["current_persona"] = persona
+                            continue
+
                         if state["mode"] == IDLE:
                             send_mode = "wake"
                             send_persona = None
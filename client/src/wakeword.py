@@ -0,0 +1,54 @@
+import os
+from typing import Dict, List, Optional
+
+import numpy as np
+
+try:
+    import openwakeword
+except ImportError:
+    openwakeword = None
+
+
+class LocalWakeWord:
+    """
+    On-device wake-word check with openwakeword, so wake utterances never
+    leave the Pi. Each model file maps to the persona named after it,
+    e.g. "models/samantha.onnx" -> "samantha".
+    """
+    def __init__(self, model_paths: List[str], threshold: float = 0.5):
+        self.threshold = float(threshold)
+        self._model = openwakeword.Model(wakeword_models=model_paths, inference_framework="onnx")
+        names = [os.path.splitext(os.path.basename(p))[0] for p in model_paths]
+        self._personas: Dict[str, str] = {n: n.lower() for n in names}
+
+    @classmethod
+    def from_env(cls) -> Optional["LocalWakeWord"]:
+        paths = [p.strip() for p in os.environ.get("WAKEWORD_MODELS", "").split(",") if p.strip()]
+        if not paths:
+            return None
+        if openwakeword is None:
+            print("[WAKE] WAKEWORD_MODELS set but openwakeword is not installed; using brain STT wake")
+            return None
+        threshold = float(os.environ.get("WAKEWORD_THRESHOLD", "0.5"))
+        try:
+            wake = cls(paths, threshold=threshold)
+        except Exception as e:
+            print(f"[WAKE] failed to load wake-word models ({e}); using brain STT wake")
+            return None
+        print(f"[WAKE] local wake-word models: {paths}")
+        return wake
+
+    def detect(self, pcm16: bytes) -> Optional[str]:
+        """Return the persona whose wake word scores highest above threshold in a 16 kHz PCM16 clip."""
+        clip = np.frombuffer(pcm16, dtype=np.int16)
+        preds = self._model.predict_clip(clip)
+        self._model.reset()
+
+        best_name, best_score = None, self.threshold
+        for frame in preds:
+            for name, score in frame.items():
+                if score >= best_score:
+                    best_name, best_score = name, score
+        if best_name is None:
+            return None
+        return self._personas.get(best_name, best_name.lower())